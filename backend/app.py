@@ -1,288 +1,794 @@
 # app.py - Servidor de backend com Flask e Neo4j para o Sistema de Biblioteca
 
 # --- 1. IMPORTAÇÕES ---
-from flask import Flask, request, jsonify, send_from_directory
-from neo4j import GraphDatabase
+from flask import Flask, Blueprint, request, send_from_directory, stream_with_context
+from neo4j import GraphDatabase, Query, Result, RoutingControl, READ_ACCESS, WRITE_ACCESS
 from dotenv import load_dotenv
 import os
 from flask_cors import CORS
+from flask_compress import Compress
 import atexit
+import gzip
+import hashlib
+import hmac
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import threading
+from functools import wraps
+from typing import Annotated, List, Optional, Union
+from cachetools import TTLCache
+import msgspec
+import orjson
 
 # --- 2. CONFIGURAÇÃO INICIAL DO APP ---
 load_dotenv()
 
+# Logs vão para uma fila em memória; uma thread separada (QueueListener) faz a
+# escrita no stderr, então as rotas nunca esperam pela E/S do log.
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+_log_listener = None
+
+def start_log_listener():
+    global _log_listener
+    _log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+    _log_listener.start()
+
+def stop_log_listener():
+    _log_listener.stop()
+
+start_log_listener()
+atexit.register(stop_log_listener)
+# Threads não sobrevivem ao fork (e, sob gevent, um greenlet do mestre sobreviveria
+# pela metade no worker): o listener é parado antes do fork, esvaziando a fila, e
+# reiniciado nos dois processos logo depois.
+os.register_at_fork(before=stop_log_listener, after_in_parent=start_log_listener,
+                    after_in_child=start_log_listener)
+
+logger = logging.getLogger("app")
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+logger.propagate = False
+
 # Aponta para a pasta do frontend. Esta parte está correta.
 app = Flask(__name__, static_folder='../frontend')
 CORS(app)
 
+# Em produção, o ideal é um nginx na frente servindo ../frontend direto (sendfile,
+# sem passar pelo Python) e repassando só /api/ ao gunicorn: SERVE_FRONTEND=0
+# desliga as rotas de arquivos do Flask. Sem nginx, USE_X_SENDFILE=1 delega o
+# envio dos arquivos ao servidor web (Apache/lighttpd) pelo cabeçalho X-Sendfile.
+SERVE_FRONTEND = os.getenv("SERVE_FRONTEND", "1") == "1"
+app.config["USE_X_SENDFILE"] = os.getenv("USE_X_SENDFILE") == "1"
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+# Compressão das respostas (JSON, CSS, JS, SVG). O JSON das rotas repete os mesmos
+# nomes de campo em cada registro e encolhe bastante. Respostas pequenas não compensam
+# o custo. HTML fica de fora: o index.html já tem a sua cópia gzip pré-calculada e o
+# serve_index decide sozinho entre ela e o corpo sem compressão.
+app.config["COMPRESS_MIMETYPES"] = [
+    'application/json', 'text/css', 'text/javascript', 'application/javascript', 'image/svg+xml',
+]
+app.config["COMPRESS_ALGORITHM"] = ['br', 'gzip']
+app.config["COMPRESS_MIN_SIZE"] = 1024
+# Respostas em streaming (debug/all_data, arquivos estáticos) são comprimidas por blocos.
+# O flask-compress não faz gzip em streaming e só usa algoritmos que o cliente aceita:
+# quem aceita apenas gzip recebe essas respostas sem compressão.
+app.config["COMPRESS_ALGORITHM_STREAMING"] = ['br', 'deflate']
+# O ETag ganha o sufixo do algoritmo; reavalia o If-None-Match dos estáticos para manter o 304.
+app.config["COMPRESS_STREAMING_ENDPOINT_CONDITIONAL"] = ['serve_static_files']
+if app.config["USE_X_SENDFILE"]:
+    # Com X-Sendfile o corpo é enviado pelo servidor web; aqui só comprime o JSON da API.
+    app.config["COMPRESS_MIMETYPES"] = ['application/json']
+Compress(app)
+
+# Todas as respostas JSON usam orjson (extensão nativa) no lugar do json da stdlib do jsonify.
+# default=str cobre tipos que o orjson não conhece, como datas/horas do Neo4j.
+def ojsonify(obj, status=200):
+    return app.response_class(orjson.dumps(obj, default=str), status=status, mimetype='application/json')
+
 # --- 3. CONEXÃO COM O BANCO DE DADOS NEO4J ---
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+# Banco explícito: evita a descoberta do "home database" a cada sessão/consulta.
+DB = os.getenv("NEO4J_DATABASE", "neo4j")
+# Limites de tempo das transações (segundos): uma consulta ruim ou um plano
+# degradado não pode prender uma conexão Bolt indefinidamente.
+READ_TIMEOUT = 5
+WRITE_TIMEOUT = 10
+# Registros por PULL; as rotas leem poucas linhas, então lotes de 1000 são desnecessários.
+FETCH_SIZE = 100
+# Pool de conexões Bolt por processo; ajustável conforme o número de workers/greenlets.
+MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "5"))
+
+# --- CONSULTAS CYPHER ---
+# Texto fixo definido uma única vez: as rotas só escolhem a constante e o plano
+# em cache no servidor é sempre reaproveitado. Os objetos Query já levam o
+# timeout da transação, então também não são recriados a cada requisição.
+# Autor opcional: $author = null desliga o filtro, então uma só consulta (e um só
+# plano em cache) atende às duas buscas.
+Q_RECOMMENDATIONS = Query("""
+    MATCH (l:Livro)-[:TEM_GENERO]->(g:Genero)
+    WHERE g.nome_lower CONTAINS toLower($genre)
+    OPTIONAL MATCH (a:Autor)-[:ESCREVEU]->(l)
+    WITH l, g, a
+    WHERE $author IS NULL OR a.nome_lower CONTAINS toLower($author)
+    RETURN l.titulo AS title, coalesce(a.nome, 'Desconhecido') AS author, g.nome AS genre,
+           coalesce(l.ano, 'N/A') AS year, coalesce(l.paginas, 'N/A') AS pages
+    LIMIT 10
+""", timeout=READ_TIMEOUT)
+
+# Paginado: primeiro escolhe a página de livros (ordenada pelo índice de titulo) e só
+# então agrega autores/gêneros/editoras desses livros. collect() já descarta NULL; o
+# filtro remove também nomes vazios no servidor, então as listas chegam prontas.
+Q_DEBUG_ALL = Query("""
+    MATCH (l:Livro)
+    WITH l ORDER BY l.titulo SKIP $offset LIMIT $limit
+    OPTIONAL MATCH (a:Autor)-[:ESCREVEU]->(l)
+    OPTIONAL MATCH (l)-[:TEM_GENERO]->(g:Genero)
+    OPTIONAL MATCH (l)-[:PUBLICADO_POR]->(p:Editora)
+    RETURN l.titulo AS title,
+           [x IN collect(DISTINCT a.nome) WHERE x <> ''] AS authors,
+           [x IN collect(DISTINCT g.nome) WHERE x <> ''] AS genres,
+           [x IN collect(DISTINCT p.nome) WHERE x <> ''] AS publishers,
+           l.ano AS year,
+           l.paginas AS pages
+    ORDER BY title
+""", timeout=READ_TIMEOUT)
+
+DEBUG_PAGE_SIZE = 100
+DEBUG_MAX_PAGE_SIZE = 1000
+
+# Limites de página de Q_DEBUG_ALL, tanto em /api/debug/all_data quanto no template
+# 'all_books' de /api/cypher. Levanta ValueError/TypeError se não forem inteiros.
+def page_bounds(offset, limit):
+    return max(int(offset), 0), min(max(int(limit), 1), DEBUG_MAX_PAGE_SIZE)
+
+Q_GENRES = Query("MATCH (g:Genero) RETURN g.nome AS genre ORDER BY g.nome", timeout=READ_TIMEOUT)
+
+Q_AUTHORS = Query("MATCH (a:Autor) RETURN a.nome AS author ORDER BY a.nome", timeout=READ_TIMEOUT)
+
+# Painel inteiro numa ida ao banco: os totais mais os autores com mais livros e os
+# gêneros com mais livros, cada ranking já agregado em lista no servidor.
+# MATCH (n:Rotulo) RETURN count(n) é respondido pelo count store do Neo4j, sem
+# percorrer os nós.
+Q_DASHBOARD = Query("""
+    CALL { MATCH (a:Autor) RETURN count(a) AS total_authors }
+    CALL { MATCH (l:Livro) RETURN count(l) AS total_books }
+    CALL { MATCH (g:Genero) RETURN count(g) AS total_genres }
+    CALL { MATCH (p:Editora) RETURN count(p) AS total_publishers }
+    CALL {
+        MATCH (a:Autor)-[:ESCREVEU]->(l:Livro)
+        WITH a, count(l) AS book_count ORDER BY book_count DESC, a.nome LIMIT 5
+        RETURN collect({author: a.nome, book_count: book_count}) AS top_authors
+    }
+    CALL {
+        MATCH (l:Livro)-[:TEM_GENERO]->(g:Genero)
+        WITH g, count(l) AS book_count ORDER BY book_count DESC, g.nome LIMIT 5
+        RETURN collect({genre: g.nome, book_count: book_count}) AS top_genres
+    }
+    RETURN total_authors, total_books, total_genres, total_publishers, top_authors, top_genres
+""", timeout=READ_TIMEOUT)
+
+# Uma única instrução (um round trip) em vez de um tx.run por nó/relação. A editora é
+# opcional: o Python escolhe a variante com ou sem ela, sem ramificação no Cypher.
+_ADD_BOOK_AUTHOR_AND_TITLE = """
+    MERGE (a:Autor {nome: $author}) SET a.nome_lower = toLower($author)
+    MERGE (l:Livro {titulo: $title}) SET l += $props
+    MERGE (a)-[:ESCREVEU]->(l)
+"""
+_ADD_BOOK_PUBLISHER = """
+    MERGE (p:Editora {nome: $publisher}) SET p.nome_lower = toLower($publisher)
+    MERGE (l)-[:PUBLICADO_POR]->(p)
+"""
+_ADD_BOOK_GENRES = """
+    WITH l
+    UNWIND $genres AS genre_name
+        MERGE (g:Genero {nome: genre_name}) SET g.nome_lower = toLower(genre_name)
+        MERGE (l)-[:TEM_GENERO]->(g)
+"""
+Q_ADD_BOOK = Query(_ADD_BOOK_AUTHOR_AND_TITLE + _ADD_BOOK_GENRES, timeout=WRITE_TIMEOUT)
+Q_ADD_BOOK_WITH_PUBLISHER = Query(
+    _ADD_BOOK_AUTHOR_AND_TITLE + _ADD_BOOK_PUBLISHER + _ADD_BOOK_GENRES, timeout=WRITE_TIMEOUT
+)
+
+# Mesma gravação de Q_ADD_BOOK para vários livros de uma vez (UNWIND sobre as linhas).
+Q_ADD_BOOKS = Query("""
+    UNWIND $rows AS row
+    MERGE (a:Autor {nome: row.author}) SET a.nome_lower = toLower(row.author)
+    MERGE (l:Livro {titulo: row.title}) SET l += row.props
+    MERGE (a)-[:ESCREVEU]->(l)
+    FOREACH (genre_name IN row.genres |
+        MERGE (g:Genero {nome: genre_name}) SET g.nome_lower = toLower(genre_name)
+        MERGE (l)-[:TEM_GENERO]->(g))
+    FOREACH (_ IN CASE WHEN row.publisher IS NULL THEN [] ELSE [1] END |
+        MERGE (p:Editora {nome: row.publisher}) SET p.nome_lower = toLower(row.publisher)
+        MERGE (l)-[:PUBLICADO_POR]->(p))
+""", timeout=WRITE_TIMEOUT)
+# Livros por transação em /api/add_books: cada lote precisa caber no WRITE_TIMEOUT.
+ADD_BOOKS_BATCH_SIZE = 500
+
+# Apaga em lotes, cada um na sua própria transação, para não segurar o lock de todos
+# os nós nem estourar o heap do Neo4j. CALL { ... } IN TRANSACTIONS só funciona em
+# transação implícita (session.run), nunca dentro de begin_transaction/execute_write.
+Q_CLEAR_DATABASE = """
+    MATCH (n)
+    CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+# Consultas que /api/cypher aceita pelo nome ({"template": ..., "params": {...}}).
+# Texto fixo mantém o cache de planos do Neo4j aquecido e limita o custo no banco.
+CYPHER_TEMPLATES = {
+    "recommendations": Q_RECOMMENDATIONS,  # parâmetros: genre, author (ou null)
+    "genres": Q_GENRES,
+    "authors": Q_AUTHORS,
+    "all_books": Q_DEBUG_ALL,  # parâmetros: offset, limit
+    "dashboard": Q_DASHBOARD,
+}
+
+# Cypher livre só é aceito com o cabeçalho X-Cypher-Token igual a esta variável;
+# sem ela configurada, o console fica desativado.
+CYPHER_CONSOLE_TOKEN = os.getenv("CYPHER_CONSOLE_TOKEN")
+CYPHER_CONSOLE_TIMEOUT = 2  # segundos
+# Orçamento da consulta livre: o EXPLAIN é verificado antes da execução e planos
+# com algum operador estimado acima deste número de linhas são recusados.
+CYPHER_CONSOLE_MAX_ESTIMATED_ROWS = 1_000_000
+
+# Restrições de unicidade: cada uma cria o índice que transforma os MERGE/MATCH
+# por nome/título em buscas indexadas em vez de varrer todos os nós do rótulo.
+SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT livro_titulo IF NOT EXISTS FOR (l:Livro) REQUIRE l.titulo IS UNIQUE",
+    "CREATE CONSTRAINT autor_nome IF NOT EXISTS FOR (a:Autor) REQUIRE a.nome IS UNIQUE",
+    "CREATE CONSTRAINT genero_nome IF NOT EXISTS FOR (g:Genero) REQUIRE g.nome IS UNIQUE",
+    "CREATE CONSTRAINT editora_nome IF NOT EXISTS FOR (p:Editora) REQUIRE p.nome IS UNIQUE",
+    # Busca sem diferenciar maiúsculas: 'nome_lower' é gravado junto com 'nome' e o
+    # índice TEXT atende ao CONTAINS sem aplicar toLower() em cada nó a cada consulta
+    # (só o termo buscado passa por toLower(), uma vez por consulta).
+    "CREATE TEXT INDEX genero_nome_lower IF NOT EXISTS FOR (g:Genero) ON (g.nome_lower)",
+    "CREATE TEXT INDEX autor_nome_lower IF NOT EXISTS FOR (a:Autor) ON (a.nome_lower)",
+    "CREATE TEXT INDEX editora_nome_lower IF NOT EXISTS FOR (p:Editora) ON (p.nome_lower)",
+    # Preenche 'nome_lower' em nós criados antes desta propriedade existir.
+    "MATCH (g:Genero) WHERE g.nome_lower IS NULL SET g.nome_lower = toLower(g.nome)",
+    "MATCH (a:Autor) WHERE a.nome_lower IS NULL SET a.nome_lower = toLower(a.nome)",
+    "MATCH (p:Editora) WHERE p.nome_lower IS NULL SET p.nome_lower = toLower(p.nome)",
+    # Índices novos são populados em segundo plano; espera um pouco que fiquem ONLINE
+    # para que as primeiras consultas já usem busca indexada. A espera é curta porque
+    # roda na importação, antes de o gunicorn abrir a porta (o Heroku derruba o
+    # processo web que não abre a porta em 60s). Se estourar, só gera um aviso: as
+    # consultas funcionam e passam a usar os índices quando ficarem prontos.
+    "CALL db.awaitIndexes(20)",
+]
+
+# Sessões sempre com o banco explícito. As de leitura são roteadas para réplicas
+# num cluster, aliviando o líder. O objeto retornado funciona com "with".
+def read_session():
+    return get_driver().session(database=DB, default_access_mode=READ_ACCESS)
+
+def write_session():
+    return get_driver().session(database=DB, default_access_mode=WRITE_ACCESS)
+
+def ensure_schema(driver):
+    with driver.session(database=DB, default_access_mode=WRITE_ACCESS) as session:
+        for statement in SCHEMA_STATEMENTS:
+            try:
+                session.run(statement).consume()
+            except Exception as e:
+                # Ex.: dados duplicados já existentes impedem a criação da restrição.
+                logger.warning("Não foi possível aplicar '%s'. Erro: %s", statement, e)
+
+def create_driver():
+    try:
+        return GraphDatabase.driver(
+            NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD),
+            max_connection_pool_size=MAX_POOL_SIZE,             # teto de conexões Bolt simultâneas
+            connection_acquisition_timeout=ACQUISITION_TIMEOUT, # falha rápido se o pool esgotar
+            max_connection_lifetime=3600,                       # recicla conexões antes que proxies/NAT as derrubem
+            keep_alive=True,                                    # TCP keep-alive evita reconexões (e novos handshakes TLS)
+            liveness_check_timeout=30,                          # testa conexões ociosas há 30s antes de reusá-las
+            fetch_size=FETCH_SIZE,
+        )
+    except Exception as e:
+        logger.critical("Não foi possível criar o driver do Neo4j. Erro: %s", e)
+        return None
+
+# Um driver por processo, criado sob demanda no primeiro uso: com gunicorn --preload,
+# cada worker cria o seu depois do fork, já que conexões Bolt herdadas do processo
+# pai não podem ser compartilhadas entre processos.
+_driver = None
+_driver_lock = threading.Lock()
+# GraphDatabase.driver() só falha por configuração inválida (esquema da URI, auth):
+# tentar de novo a cada requisição não resolve e só repetiria o log. A falha fica
+# registrada e as rotas voltam direto para o 503.
+_driver_failed = False
+
+# Abre algumas conexões logo após criar o driver, para que as primeiras requisições
+# do processo não paguem o handshake TCP/TLS/Bolt. Só acontece onde o driver é usado
+# de fato: nos workers (o gunicorn.conf.py cria o driver quando cada um sobe) ou no
+# servidor de desenvolvimento, nunca no mestre. As consultas ficam abertas ao mesmo
+# tempo de propósito: em sequência, todas reusariam a mesma conexão.
+POOL_WARM_SIZE = min(os.cpu_count() or 1, 8)
+
+def warm_pool(driver):
+    sessions = [driver.session(database=DB, default_access_mode=READ_ACCESS) for _ in range(POOL_WARM_SIZE)]
+    try:
+        results = [session.run("RETURN 1") for session in sessions]
+        for result in results:
+            result.consume()
+    except Exception as e:
+        logger.warning("Não foi possível pré-aquecer o pool de conexões. Erro: %s", e)
+    finally:
+        for session in sessions:
+            session.close()
+
+def get_driver():
+    global _driver, _driver_failed
+    if _driver is None and not _driver_failed:
+        with _driver_lock:
+            if _driver is None and not _driver_failed:
+                _driver = create_driver()
+                _driver_failed = _driver is None
+                if _driver:
+                    # Em segundo plano (um greenlet, sob o worker gevent) para não atrasar quem chamou.
+                    threading.Thread(target=warm_pool, args=(_driver,), daemon=True).start()
+    return _driver
+
+def reset_driver_after_fork():
+    global _driver, _driver_failed, _driver_lock
+    # Sem close(): fechar aqui encerraria as conexões que pertencem ao processo pai.
+    _driver = None
+    _driver_failed = False
+    _driver_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_driver_after_fork)
+
+# Na importação (no processo mestre, com --preload) um driver temporário só confere
+# a conexão e aplica o schema. Ele é fechado em seguida: o mestre não atende
+# requisições e não deve manter um pool aberto durante toda a vida do processo.
+def init_database():
+    global _driver_failed
+    driver = create_driver()
+    if not driver:
+        _driver_failed = True
+        return
+    try:
+        driver.verify_connectivity()
+        logger.info("Conexão com Neo4j estabelecida com sucesso.")
+        ensure_schema(driver)
+    except Exception as e:
+        logger.critical("Não foi possível conectar ao Neo4j. Erro: %s", e)
+    finally:
+        driver.close()
 
-driver = None
-try:
-    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
-    driver.verify_connectivity()
-    print(">>> Conexão com Neo4j estabelecida com sucesso.")
-except Exception as e:
-    print(f">>> ERRO CRÍTICO: Não foi possível conectar ao Neo4j. Erro: {e}")
+init_database()
 
 @atexit.register
 def close_db():
-    if driver:
-        driver.close()
-        print(">>> Conexão com Neo4j fechada.")
+    if _driver:
+        _driver.close()
+        logger.info("Conexão com Neo4j fechada.")
+
+# --- 4. CACHE DAS ROTAS DE LEITURA ---
+# Listas de gêneros/autores, estatísticas e buscas repetidas mudam pouco: guardamos
+# o JSON já serializado por CACHE_TTL segundos e evitamos a ida ao Neo4j e a nova
+# serialização. Qualquer escrita invalida o cache de todos os workers.
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+_cache = TTLCache(maxsize=1024, ttl=CACHE_TTL)
+_cache_lock = threading.Lock()
+# Cada worker tem o seu _cache, mas a "geração" fica em memória compartilhada, criada
+# antes do fork (--preload) e herdada por todos. Uma escrita incrementa a geração e
+# as entradas gravadas com a geração anterior deixam de valer em todos os processos.
+_cache_generation = multiprocessing.Value('Q', 0)
+
+# Cada resposta em cache leva um ETag do próprio JSON. Com "no-cache" o navegador
+# sempre revalida (e vê escritas na hora), mas recebe 304 sem corpo se nada mudou.
+def conditional_json(body, etag):
+    response = app.response_class(body, status=200, mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+def cached_response(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = (request.endpoint, frozenset(request.args.items()))
+        # Lida antes da consulta: uma escrita durante a consulta já invalida o resultado.
+        generation = _cache_generation.value
+        with _cache_lock:
+            entry = _cache.get(key)
+        if entry is not None and entry[2] == generation:
+            return conditional_json(entry[0], entry[1])
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        body = response.get_data()
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        with _cache_lock:
+            _cache[key] = (body, etag, generation)
+        return conditional_json(body, etag)
+    return wrapper
+
+def invalidate_cache():
+    with _cache_generation.get_lock():
+        _cache_generation.value += 1
+    with _cache_lock:
+        _cache.clear()
+
+# --- 5. ROTAS PARA SERVIR O FRONTEND (AQUI ESTÁ A CORREÇÃO) ---
+
+# O index.html é lido uma vez na inicialização e guardado já comprimido com gzip e
+# com ETag calculado (alterações no arquivo exigem reiniciar o app).
+def load_index_html():
+    try:
+        with open(os.path.join(app.static_folder, 'index.html'), 'rb') as f:
+            html = f.read()
+    except OSError:
+        return None
+    return html, gzip.compress(html, 6), hashlib.md5(html).hexdigest()
 
-# --- 4. ROTAS PARA SERVIR O FRONTEND (AQUI ESTÁ A CORREÇÃO) ---
+_index_html = load_index_html() if SERVE_FRONTEND else None
 
 # Rota principal que serve o index.html
-@app.route('/')
 def serve_index():
-    return send_from_directory(app.static_folder, 'index.html')
-
-# Rota "CORINGA": Se a rota não for da API, tenta servir como um arquivo estático.
+    if _index_html is None:
+        return send_from_directory(app.static_folder, 'index.html')
+
+    html, html_gz, etag = _index_html
+    # Respeita o valor q: 'gzip;q=0' recusa gzip explicitamente.
+    use_gzip = request.accept_encodings['gzip'] > 0
+    response = app.response_class(html_gz if use_gzip else html, mimetype='text/html')
+    if use_gzip:
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    response.set_etag(etag)
+    # Responde 304 sem corpo quando o If-None-Match do navegador bate com o ETag.
+    return response.make_conditional(request)
+
+# Rota "CORINGA": serve qualquer outro arquivo da pasta 'frontend'.
 # Isso é essencial para que o navegador encontre outros arquivos que o HTML possa precisar.
-@app.route('/<path:path>')
+# Caminhos /api/... nunca chegam aqui: o roteamento do Werkzeug prefere as regras
+# do blueprint da API, que são mais específicas.
 def serve_static_files(path):
-    # Verifica se o caminho solicitado não começa com 'api/'
-    if not path.startswith('api/'):
-        # Tenta servir o arquivo solicitado da pasta 'frontend'
-        return send_from_directory(app.static_folder, path)
-    # Se começar com 'api/', o Flask continuará procurando uma rota de API correspondente.
-    # Retornamos um 404 explícito se nenhuma rota de API for encontrada.
-    return jsonify({"error": "Rota de API não encontrada"}), 404
+    # Arquivos além do index.html podem ficar em cache no navegador por uma hora.
+    return send_from_directory(app.static_folder, path, max_age=STATIC_MAX_AGE)
 
+if SERVE_FRONTEND:
+    app.add_url_rule('/', view_func=serve_index)
+    app.add_url_rule('/<path:path>', view_func=serve_static_files)
 
-# --- 5. ROTAS DA API ---
-# Todo o seu código de API continua abaixo, sem alterações.
+# --- 6. ROTAS DA API ---
+# Todas as rotas da API ficam no blueprint com prefixo /api.
+api_bp = Blueprint('api', __name__, url_prefix='/api')
 
-@app.route('/api/recommendations', methods=['GET'])
+@api_bp.route('/recommendations', methods=['GET'])
+@cached_response
 def get_recommendations():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
 
     genre = request.args.get('genre')
     author = request.args.get('author')
 
     if not genre:
-        return jsonify({"error": "O parâmetro 'genre' é obrigatório."}), 400
+        return ojsonify({"error": "O parâmetro 'genre' é obrigatório."}, 400)
 
     if author and author.lower() not in ['qualquer', '', 'any']:
-        query = """
-            MATCH (l:Livro)-[:TEM_GENERO]->(g:Genero)
-            WHERE toLower(g.nome) CONTAINS toLower($genre)
-            WITH l, g
-            MATCH (a:Autor)-[:ESCREVEU]->(l)
-            WHERE toLower(a.nome) CONTAINS toLower($author)
-            RETURN l.titulo AS title, a.nome AS author, g.nome AS genre, l.ano AS year, l.paginas AS pages
-            LIMIT 10
-        """
         params = {"genre": genre, "author": author}
     else:
-        query = """
-            MATCH (l:Livro)-[:TEM_GENERO]->(g:Genero)
-            WHERE toLower(g.nome) CONTAINS toLower($genre)
-            OPTIONAL MATCH (a:Autor)-[:ESCREVEU]->(l)
-            RETURN l.titulo AS title, a.nome AS author, g.nome AS genre, l.ano AS year, l.paginas AS pages
-            LIMIT 10
-        """
-        params = {"genre": genre}
+        params = {"genre": genre, "author": None}
 
     try:
-        with driver.session() as session:
-            result = session.run(query, params)
-            recommendations = [
-                {
-                    "title": record["title"],
-                    "author": record["author"] if record["author"] else "Desconhecido",
-                    "genre": record["genre"],
-                    "year": record["year"] if record["year"] else "N/A",
-                    "pages": record["pages"] if record["pages"] else "N/A"
-                } for record in result
-            ]
-            return jsonify(recommendations), 200
+        records, _, _ = driver.execute_query(Q_RECOMMENDATIONS, params, database_=DB, routing_=RoutingControl.READ)
+        # Os valores padrão já vêm do coalesce() na consulta.
+        recommendations = [dict(record) for record in records]
+        return ojsonify(recommendations)
     except Exception as e:
-        print(f"Erro ao executar consulta Cypher: {e}")
-        return jsonify({"error": "Erro interno do servidor ao buscar recomendações."}), 500
+        logger.exception("Erro ao executar consulta Cypher: %s", e)
+        return ojsonify({"error": "Erro interno do servidor ao buscar recomendações."}, 500)
 
 
-@app.route('/api/debug/all_data', methods=['GET'])
+@api_bp.route('/debug/all_data', methods=['GET'])
 def debug_all_data():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
     
+    offset, limit = page_bounds(request.args.get('offset', 0, type=int),
+                                request.args.get('limit', DEBUG_PAGE_SIZE, type=int))
+
+    # Os livros são enviados conforme chegam do Neo4j, sem montar a lista inteira em memória.
+    session = read_session()
     try:
-        with driver.session() as session:
-            query = """
-            MATCH (l:Livro)
-            OPTIONAL MATCH (a:Autor)-[:ESCREVEU]->(l)
-            OPTIONAL MATCH (l)-[:TEM_GENERO]->(g:Genero)
-            OPTIONAL MATCH (l)-[:PUBLICADO_POR]->(p:Editora)
-            RETURN l.titulo AS title, 
-                   collect(DISTINCT a.nome) AS authors,
-                   collect(DISTINCT g.nome) AS genres,
-                   collect(DISTINCT p.nome) AS publishers,
-                   l.ano AS year,
-                   l.paginas AS pages
-            ORDER BY l.titulo
-            """
-            result = session.run(query)
-            data = [
-                {
-                    "title": record["title"],
-                    "authors": [a for a in record["authors"] if a],
-                    "genres": [g for g in record["genres"] if g],
-                    "publishers": [p for p in record["publishers"] if p],
-                    "year": record["year"],
-                    "pages": record["pages"]
-                } for record in result
-            ]
-            return jsonify({"total_books": len(data), "books": data}), 200
+        result = session.run(Q_DEBUG_ALL, {"offset": offset, "limit": limit})
+        result.peek()  # Faz erros da consulta aparecerem aqui, antes de a resposta começar.
     except Exception as e:
-        print(f"Erro ao buscar dados para debug: {e}")
-        return jsonify({"error": f"Erro ao buscar dados: {str(e)}"}), 500
-
-
-@app.route('/api/genres', methods=['GET'])
+        session.close()
+        logger.exception("Erro ao buscar dados para debug: %s", e)
+        return ojsonify({"error": f"Erro ao buscar dados: {str(e)}"}, 500)
+
+    def generate():
+        try:
+            yield b'{"books":['
+            total_books = 0
+            for record in result:
+                # Vírgula e livro num único pedaço: metade das escritas no socket.
+                # As colunas da consulta já têm os nomes do JSON de saída.
+                separator = b',' if total_books else b''
+                yield separator + orjson.dumps(dict(record), default=str)
+                total_books += 1
+            yield b'],"total_books":%d,"offset":%d,"limit":%d}' % (total_books, offset, limit)
+        finally:
+            session.close()
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+
+@api_bp.route('/genres', methods=['GET'])
+@cached_response
 def get_genres():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
     
     try:
-        with driver.session() as session:
-            result = session.run("MATCH (g:Genero) RETURN g.nome AS genre ORDER BY g.nome")
-            genres = [record["genre"] for record in result]
-            return jsonify(genres), 200
+        records, _, _ = driver.execute_query(Q_GENRES, database_=DB, routing_=RoutingControl.READ)
+        genres = [record[0] for record in records]
+        return ojsonify(genres)
     except Exception as e:
-        print(f"Erro ao buscar gêneros: {e}")
-        return jsonify({"error": f"Erro ao buscar gêneros: {str(e)}"}), 500
+        logger.exception("Erro ao buscar gêneros: %s", e)
+        return ojsonify({"error": f"Erro ao buscar gêneros: {str(e)}"}, 500)
 
 
-@app.route('/api/authors', methods=['GET'])
+@api_bp.route('/authors', methods=['GET'])
+@cached_response
 def get_authors():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
     
     try:
-        with driver.session() as session:
-            result = session.run("MATCH (a:Autor) RETURN a.nome AS author ORDER BY a.nome")
-            authors = [record["author"] for record in result]
-            return jsonify(authors), 200
+        records, _, _ = driver.execute_query(Q_AUTHORS, database_=DB, routing_=RoutingControl.READ)
+        authors = [record[0] for record in records]
+        return ojsonify(authors)
     except Exception as e:
-        print(f"Erro ao buscar autores: {e}")
-        return jsonify({"error": f"Erro ao buscar autores: {str(e)}"}), 500
+        logger.exception("Erro ao buscar autores: %s", e)
+        return ojsonify({"error": f"Erro ao buscar autores: {str(e)}"}, 500)
 
 
-@app.route('/api/cypher', methods=['POST'])
+@api_bp.route('/dashboard', methods=['GET'])
+@cached_response
+def get_dashboard():
+    driver = get_driver()
+    if not driver:
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
+
+    try:
+        records, _, _ = driver.execute_query(Q_DASHBOARD, database_=DB, routing_=RoutingControl.READ)
+        return ojsonify(dict(records[0]))
+    except Exception as e:
+        logger.exception("Erro ao buscar o painel: %s", e)
+        return ojsonify({"error": f"Erro ao buscar o painel: {str(e)}"}, 500)
+
+
+# Maior número de linhas estimado entre todos os operadores do plano (EXPLAIN).
+def max_estimated_rows(plan):
+    rows = plan.get('args', {}).get('EstimatedRows', 0)
+    return max([rows] + [max_estimated_rows(child) for child in plan.get('children', [])])
+
+@api_bp.route('/cypher', methods=['POST'])
 def execute_cypher_query():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
     
     data = request.get_json()
+    template = data.get('template')
     query = data.get('query')
-    params = data.get('params', {})
+    # "params": null (ou ausente) equivale a nenhum parâmetro.
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return ojsonify({"error": "O campo 'params' deve ser um objeto JSON."}, 400)
+
+    if template:
+        if template not in CYPHER_TEMPLATES:
+            return ojsonify({"error": f"Template de consulta desconhecido: '{template}'."}, 400)
+        if template == "all_books":
+            try:
+                offset, limit = page_bounds(params.get('offset', 0), params.get('limit', DEBUG_PAGE_SIZE))
+            except (TypeError, ValueError):
+                return ojsonify({"error": "Os parâmetros 'offset' e 'limit' devem ser inteiros."}, 400)
+            params = {**params, "offset": offset, "limit": limit}
+        try:
+            records, _, keys = driver.execute_query(
+                CYPHER_TEMPLATES[template], params, database_=DB, routing_=RoutingControl.READ
+            )
+            # Os templates só retornam valores simples: basta parear as colunas com os
+            # valores de cada Record (uma tupla), sem o record.data() recursivo.
+            return ojsonify([dict(zip(keys, record)) for record in records])
+        except Exception as e:
+            return ojsonify({"error": f"Erro ao executar consulta Cypher: {str(e)}"}, 500)
 
     if not query:
-        return jsonify({"error": "A consulta Cypher é obrigatória."}), 400
+        return ojsonify({"error": "A consulta Cypher é obrigatória."}, 400)
+
+    token = request.headers.get('X-Cypher-Token', '')
+    if not CYPHER_CONSOLE_TOKEN or not hmac.compare_digest(token.encode(), CYPHER_CONSOLE_TOKEN.encode()):
+        return ojsonify({"error": "Consulta Cypher livre não autorizada; use um 'template'."}, 403)
 
     try:
-        with driver.session() as session:
-            result = session.run(query, params)
+        with write_session() as session:
+            # EXPLAIN só planeja (não executa). Sem plano não há como conferir o custo,
+            # então a consulta é recusada (ex.: opções "CYPHER ..." no início, que
+            # teriam de vir antes do EXPLAIN).
+            try:
+                plan = session.run("EXPLAIN " + query, params).consume().plan
+            except Exception as e:
+                return ojsonify({"error": f"Não foi possível estimar o custo da consulta: {str(e)}"}, 400)
+            if not plan or max_estimated_rows(plan) > CYPHER_CONSOLE_MAX_ESTIMATED_ROWS:
+                return ojsonify({"error": "Consulta recusada: custo estimado acima do limite permitido."}, 422)
+
+            result = session.run(
+                Query(query, timeout=CYPHER_CONSOLE_TIMEOUT, metadata={"source": "api/cypher"}), params
+            )
             try:
                 records = [record.data() for record in result]
             except Exception:
                 summary = result.consume()
                 records = [{"summary": summary.counters.__dict__}]
-            return jsonify(records), 200
+            invalidate_cache()
+            return ojsonify(records)
     except Exception as e:
-        return jsonify({"error": f"Erro ao executar consulta Cypher: {str(e)}"}), 500
+        return ojsonify({"error": f"Erro ao executar consulta Cypher: {str(e)}"}, 500)
 
 
-@app.route('/api/clear_database', methods=['POST'])
+@api_bp.route('/clear_database', methods=['POST'])
 def clear_database_endpoint():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
     try:
-        with driver.session() as session:
-            session.run("MATCH (n) DETACH DELETE n")
-        return jsonify({"message": "Banco de dados limpo com sucesso!"}), 200
+        with write_session() as session:
+            session.run(Q_CLEAR_DATABASE).consume()
+        invalidate_cache()
+        return ojsonify({"message": "Banco de dados limpo com sucesso!"})
     except Exception as e:
-        print(f"Erro ao limpar o banco de dados: {e}")
-        return jsonify({"error": f"Erro ao limpar o banco de dados: {str(e)}"}), 500
+        logger.exception("Erro ao limpar o banco de dados: %s", e)
+        return ojsonify({"error": f"Erro ao limpar o banco de dados: {str(e)}"}, 500)
 
 
-@app.route('/api/test_connection', methods=['GET'])
+@api_bp.route('/test_connection', methods=['GET'])
 def test_connection_endpoint():
+    driver = get_driver()
     if not driver:
-        return jsonify({"status": "disconnected", "message": "Driver Neo4j não inicializado."}), 503
+        return ojsonify({"status": "disconnected", "message": "Driver Neo4j não inicializado."}, 503)
     
     try:
         driver.verify_connectivity()
-        return jsonify({"status": "connected", "message": "Conexão com Neo4j estabelecida."}), 200
+        return ojsonify({"status": "connected", "message": "Conexão com Neo4j estabelecida."})
     except Exception as e:
-        return jsonify({"status": "disconnected", "message": f"Erro na conexão com Neo4j: {str(e)}"}), 500
-
-
-@app.route('/api/add_book', methods=['POST'])
+        return ojsonify({"status": "disconnected", "message": f"Erro na conexão com Neo4j: {str(e)}"}, 500)
+
+
+# Corpo de /api/add_book (e de cada item de /api/add_books). O msgspec decodifica o
+# JSON direto nestas classes e valida os tipos durante o parse; strict=False aceita
+# números enviados como texto ("1943"). 'genres' pode vir como texto separado por
+# vírgulas (formulário) ou como lista.
+NonEmptyStr = Annotated[str, msgspec.Meta(min_length=1)]
+
+class Book(msgspec.Struct):
+    title: NonEmptyStr
+    author: NonEmptyStr
+    genres: Union[str, List[str]]
+    publisher: Optional[str] = None
+    year: Optional[int] = None
+    pages: Optional[int] = None
+
+class BookBatch(msgspec.Struct):
+    books: Annotated[List[Book], msgspec.Meta(min_length=1)]
+
+book_decoder = msgspec.json.Decoder(Book, strict=False)
+book_batch_decoder = msgspec.json.Decoder(BookBatch, strict=False)
+
+# Converte um Book nos parâmetros de Q_ADD_BOOK/Q_ADD_BOOKS.
+# Retorna None se não sobrar nenhum gênero depois de remover os vazios.
+def book_params(book):
+    genres = book.genres.split(',') if isinstance(book.genres, str) else book.genres
+    genres = [g.strip() for g in genres if g.strip()]
+    if not genres:
+        return None
+
+    book_props = {}
+    if book.year is not None: book_props["ano"] = book.year
+    if book.pages is not None: book_props["paginas"] = book.pages
+
+    return {
+        "author": book.author,
+        "title": book.title,
+        "props": book_props,
+        "genres": genres,
+        "publisher": book.publisher or None
+    }
+
+
+@api_bp.route('/add_book', methods=['POST'])
 def add_book():
+    driver = get_driver()
     if not driver:
-        return jsonify({"error": "Banco de dados não conectado."}), 503
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
 
-    data = request.get_json()
-    title = data.get('title')
-    author_name = data.get('author')
-    genres_str = data.get('genres', '')
-    publisher_name = data.get('publisher')
-    year = data.get('year')
-    pages = data.get('pages')
+    try:
+        params = book_params(book_decoder.decode(request.get_data()))
+    except msgspec.MsgspecError as e:
+        return ojsonify({"error": f"Dados do livro inválidos: {e}"}, 400)
+    if params is None:
+        return ojsonify({"error": "Título, autor e pelo menos um gênero são obrigatórios."}, 400)
 
-    if not all([title, author_name, genres_str]):
-        return jsonify({"error": "Título, autor e pelo menos um gênero são obrigatórios."}), 400
+    try:
+        query = Q_ADD_BOOK_WITH_PUBLISHER if params["publisher"] else Q_ADD_BOOK
+        # Result.consume: só o resumo da escrita, sem materializar registros.
+        driver.execute_query(query, params, database_=DB, result_transformer_=Result.consume)
+        invalidate_cache()
 
-    genres = [g.strip() for g in genres_str.split(',') if g.strip()]
+        return ojsonify({"message": f"Livro '{params['title']}' adicionado/atualizado com sucesso!"}, 201)
+    except Exception as e:
+        logger.exception("Erro ao adicionar livro: %s", e)
+        return ojsonify({"error": f"Erro interno do servidor ao adicionar livro: {str(e)}"}, 500)
+
+
+# Importação em lote: {"books": [{...}, ...]} grava os livros com uma instrução por
+# lote de ADD_BOOKS_BATCH_SIZE, cada lote na sua transação, em vez de uma requisição
+# por livro. Se um lote falhar, os anteriores continuam gravados; como tudo é MERGE,
+# reenviar a lista inteira é seguro.
+@api_bp.route('/add_books', methods=['POST'])
+def add_books():
+    driver = get_driver()
+    if not driver:
+        return ojsonify({"error": "Banco de dados não conectado."}, 503)
 
     try:
-        with driver.session() as session:
-            tx = session.begin_transaction()
-            try:
-                tx.run("MERGE (a:Autor {nome: $author_name})", {"author_name": author_name})
-
-                if publisher_name:
-                    tx.run("MERGE (p:Editora {nome: $publisher_name})", {"publisher_name": publisher_name})
-
-                book_props = {}
-                if year: book_props["ano"] = int(year)
-                if pages: book_props["paginas"] = int(pages)
-                tx.run("MERGE (l:Livro {titulo: $title}) SET l += $props", {"title": title, "props": book_props})
-
-                tx.run("MATCH (a:Autor {nome: $author_name}) MATCH (l:Livro {titulo: $title}) MERGE (a)-[:ESCREVEU]->(l)",
-                       {"author_name": author_name, "title": title})
-
-                for genre_name in genres:
-                    tx.run("""
-                        MATCH (l:Livro {titulo: $title})
-                        MERGE (g:Genero {nome: $genre_name})
-                        MERGE (l)-[:TEM_GENERO]->(g)
-                    """, {"title": title, "genre_name": genre_name})
-
-                if publisher_name:
-                    tx.run("""
-                        MATCH (l:Livro {titulo: $title})
-                        MATCH (p:Editora {nome: $publisher_name})
-                        MERGE (l)-[:PUBLICADO_POR]->(p)
-                    """, {"title": title, "publisher_name": publisher_name})
-                
-                tx.commit()
-            except Exception as e:
-                tx.rollback()
-                raise e
+        batch = book_batch_decoder.decode(request.get_data())
+    except msgspec.MsgspecError as e:
+        return ojsonify({"error": f"Lista de livros inválida: {e}"}, 400)
+
+    rows = [book_params(book) for book in batch.books]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        return ojsonify({"error": f"Título, autor e pelo menos um gênero são obrigatórios (livros nas posições {missing})."}, 400)
 
-        return jsonify({"message": f"Livro '{title}' adicionado/atualizado com sucesso!"}), 201
+    count = 0
+    try:
+        for start in range(0, len(rows), ADD_BOOKS_BATCH_SIZE):
+            batch_rows = rows[start:start + ADD_BOOKS_BATCH_SIZE]
+            driver.execute_query(Q_ADD_BOOKS, {"rows": batch_rows}, database_=DB, result_transformer_=Result.consume)
+            count += len(batch_rows)
+
+        return ojsonify({"message": f"{count} livros adicionados/atualizados com sucesso!", "count": count}, 201)
     except Exception as e:
-        print(f"Erro ao adicionar livro: {e}")
-        return jsonify({"error": f"Erro interno do servidor ao adicionar livro: {str(e)}"}), 500
+        logger.exception("Erro ao adicionar livros: %s", e)
+        return ojsonify({"error": f"Erro interno do servidor ao adicionar livros: {str(e)}", "count": count}, 500)
+    finally:
+        if count:
+            invalidate_cache()
+
+
+# Qualquer /api/... sem rota correspondente responde com 404 em JSON, não com o frontend.
+@api_bp.route('/<path:path>')
+def api_not_found(path):
+    return ojsonify({"error": "Rota de API não encontrada"}, 404)
+
+
+app.register_blueprint(api_bp)
 
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
+    # Apenas para desenvolvimento local; em produção o app roda no gunicorn (Procfile).
+    app.run(debug=False, port=5000)
@@ -0,0 +1,18 @@
+# gunicorn.conf.py - Configuração do gunicorn (carregada antes de o app ser importado)
+
+# O monkey-patch do gevent tem que vir antes de qualquer import de socket/ssl/threading.
+# Com preload_app o app (e o driver do Neo4j) é importado no processo mestre, antes de o
+# worker gevent aplicar o patch: sem isto, o Bolt usaria sockets bloqueantes e cada
+# consulta travaria o worker inteiro.
+from gevent import monkey
+monkey.patch_all()
+
+preload_app = True
+worker_class = "gevent"
+worker_connections = 1000
+
+# Cria o driver do worker, e com ele pré-aquece o pool de conexões, assim que o
+# worker sobe, em vez de na primeira requisição. O mestre não mantém driver aberto.
+def post_worker_init(worker):
+    from app import get_driver
+    get_driver()